@@ -1,7 +1,6 @@
-from paxos.basic_protocol import *
-from datetime import timedelta
-import numpy as np
-import time
+from experiments.sweep import load_results, run_grid, save_results
+import matplotlib
+matplotlib.use('Agg')  # The figures are only saved, no need for an interactive backend
 import matplotlib.pyplot as plt
 import pandas as pd
 import seaborn as sns
@@ -13,50 +12,24 @@ NB_PROPOSERS = 1
 precomputed = False
 
 
-class Simulation:
-    # Class simulation to run a simulation
-
-    def __init__(self, 
-                 n_proposers: int, 
-                 n_acceptors: int,
-                 messenger_failure_rate = 0, 
-                 proposer_fail_rate=0, 
-                 messenger_max_delay=0.5
-                 ):
-        self.messenger = UnreliableMessenger(failure_rate=messenger_failure_rate, 
-                                             max_delay=messenger_max_delay)
-        self.assembly = Assembly(n_proposers=n_proposers, 
-                                 n_acceptors=n_acceptors, 
-                                 messenger=self.messenger, 
-                                 proposer_fail_rate=proposer_fail_rate, 
-                                 period_proposer=timedelta(seconds=messenger_max_delay*18 + 5)) # The 18 from page 13-14 of Leslie Lamport Part-Time Parliament paper
-
-    def start(self):
-        start_time = time.time()
-        result = self.assembly.start()
-        print(result)
-        time_measured = time.time() - start_time
-        return time_measured
-
-
 if __name__ == '__main__':
     if precomputed:
-        df_TIMES = pd.read_csv('experiments/failure_rate.csv')
+        df_TIMES = load_results('experiments/failure_rate', index_col=0)
     else:
-        TIMES = []
-        for failure_rate in FAILURE_RATE_RANGE:
-            RESULTS = []
-            for i in range(NB_SIMULATION):
-                simul = Simulation(n_proposers=NB_PROPOSERS, n_acceptors=NB_ACCEPTORS, messenger_failure_rate = failure_rate, proposer_fail_rate=0, messenger_max_delay=0)
-                RESULTS.append(simul.start())
-            TIMES.append(np.mean(RESULTS))
-        df_TIMES = pd.DataFrame(data=TIMES)
-        df_TIMES.to_csv('experiments/failure_rate.csv')
+        cfgs = [
+            dict(nb_prop=NB_PROPOSERS, nb_acc=NB_ACCEPTORS, msg_fail_rate=failure_rate, proposer_fail_rate=0, max_delay=0, seed=i)
+            for failure_rate in FAILURE_RATE_RANGE for i in range(NB_SIMULATION)
+        ]
+        T = run_grid(cfgs, (len(FAILURE_RATE_RANGE), NB_SIMULATION))
+        TIMES, STDS = T.mean(axis=1), T.std(axis=1, ddof=1)
+        df_TIMES = pd.DataFrame(data=TIMES, columns=['Time'])
+        save_results(df_TIMES, 'experiments/failure_rate')
+        save_results(pd.DataFrame(data=STDS, columns=['Std']), 'experiments/failure_rate_std')
     fig, ax = plt.subplots(figsize=(6, 6))
-    plt.plot(FAILURE_RATE_RANGE, TIMES)
+    plt.plot(FAILURE_RATE_RANGE, df_TIMES.iloc[:, 0])
     plt.ylabel("Seconds")
     plt.xlabel("Failure Rate")
     ax.set_title('Average time needed to achieve a consensus (seconds)')
-    fig.savefig('experiments/failure_rate.png')
+    fig.savefig('experiments/failure_rate.png', dpi=120)
     
 
@@ -1,39 +1,52 @@
 import datetime
+import logging
+import time
 import pandas as pd
 import seaborn as sns
+import matplotlib
+matplotlib.use('Agg')  # The figures are only saved, no need for an interactive backend
 import matplotlib.pyplot as plt
 
-from paxos.multi_paxos import ReliableMessenger, UnreliableMessenger, Assembly
+from experiments.sweep import load_results, save_results
+from paxos.multi_paxos import UnreliableMessenger, Assembly
+
+logger = logging.getLogger(__name__)
+
+PERIOD = datetime.timedelta(seconds=10)
+# Average number of failures per second an agent is up
+# Results computed when failure rates were drawn once per iteration of the agents, like the CSV file of the repo,
+#  cannot be compared with new ones
+FAILURE_RATE = 0.02
 
 
 def experiment_multi_paxos(
         precomputed=False, nb_proposers=3, nb_acceptors=5,
-        msg_fail_rate=.05, agent_fail_rate=1e-7,
+        msg_fail_rate=.05, agent_fail_rate=FAILURE_RATE,
         nb_simulations=10, max_instances=10
 ):
     if precomputed:
-        data = pd.read_csv('multi_paxos.csv')
+        data = load_results('multi_paxos')
     else:
         times = [0]
         for n in range(1, max_instances + 1):
             times.append(0)
             for j in range(nb_simulations):
-                print(f" === NEW INSTANCE OF THE ALGORITHM ({n} INSTANCES, {j+1}/{nb_simulations}) === ")
+                logger.info("New instance of the algorithm (%d instances, %d/%d)", n, j + 1, nb_simulations)
                 messenger = UnreliableMessenger(failure_rate=msg_fail_rate, max_delay=0)
                 assembly = Assembly(
                     n_proposers=nb_proposers, n_acceptors=nb_acceptors, messenger=messenger,
                     proposer_fail_rate=agent_fail_rate, acceptor_fail_rate=agent_fail_rate,
-                    nb_instances=n, period_proposer=datetime.timedelta(seconds=10)
+                    nb_instances=n, period_proposer=PERIOD
                 )
-                begin = datetime.datetime.now()
-                result = assembly.start()
-                end = datetime.datetime.now()
-                times[-1] += (end - begin).total_seconds() / nb_simulations
+                begin = time.perf_counter()
+                assembly.start()
+                end = time.perf_counter()
+                times[-1] += (end - begin) / nb_simulations
 
         data = pd.DataFrame(columns=['Number of instances', 'Time'])
         data['Time'] = times
         data['Number of instances'] = range(max_instances + 1)
-        data.to_csv('multi_paxos.csv', index=False)
+        save_results(data, 'multi_paxos', index=False)
 
     fig, ax = plt.subplots(figsize=(7, 4))
     sns.lineplot(data=data, x='Number of instances', y='Time', ax=ax)
@@ -44,7 +57,7 @@ def experiment_multi_paxos(
     ax.set_ylabel("Time")
     ax.set_xlabel("Number of instances")
     ax.set_title("Average time needed to reach consensus (seconds)")
-    fig.savefig('multi_paxos.png')
+    fig.savefig('multi_paxos.png', dpi=120)
 
 
 if __name__ == '__main__':
@@ -1,9 +1,27 @@
-import datetime
+import numpy as np
 import pandas as pd
 import seaborn as sns
+import matplotlib
+matplotlib.use('Agg')  # The figures are only saved, no need for an interactive backend
 import matplotlib.pyplot as plt
 
-from paxos.basic_protocol import ReliableMessenger, UnreliableMessenger, Assembly
+from experiments.sweep import load_results, run_grid, save_results
+
+# Period of the proposers, in seconds
+PERIOD = 10
+# Average number of failures per second an agent is up, in the experiments with failures
+# Results computed when failure rates were drawn once per iteration of the agents, like the CSV files of the repo,
+#  cannot be compared with new ones
+FAILURE_RATE = 0.02
+
+
+def long_form(times, nb_proposers, nb_acceptors):
+    """Lists the times of a (proposers, acceptors) grid as one row per cell, in a single allocation."""
+    rows = [
+        (nb_prop, str(nb_acc), time)
+        for nb_prop, row in zip(nb_proposers, np.asarray(times)) for nb_acc, time in zip(nb_acceptors, row)
+    ]
+    return pd.DataFrame(rows, columns=['Proposers', 'Acceptors', 'Time'])
 
 
 # No failure, no delay
@@ -12,35 +30,27 @@ def no_failure(precomputed=False):
     NB_ACCEPTORS = [1, 5, 10, 15, 20, 25]
     NB_SIMULATIONS = 10
     if precomputed:
-        TIMES = pd.read_csv('number_of_nodes_no_failure.csv', index_col=0)
+        TIMES = load_results('number_of_nodes_no_failure', index_col=0)
     else:
-        TIMES = []
-        for nb_prop in NB_PROPOSERS:
-            TIMES.append([])
-            for nb_acc in NB_ACCEPTORS:
-                TIMES[-1].append(0)
-                for _ in range(NB_SIMULATIONS):
-                    print(f" === NEW INSTANCE OF THE ALGORITHM ({nb_prop} PROPOSERS, {nb_acc} ACCEPTORS) === ")
-                    messenger = ReliableMessenger()
-                    assembly = Assembly(n_proposers=nb_prop, n_acceptors=nb_acc, messenger=messenger)
-                    for proposer in assembly.proposers:
-                        proposer.period = datetime.timedelta(seconds=10)
-                    begin = datetime.datetime.now()
-                    result = assembly.start()
-                    end = datetime.datetime.now()
-                    TIMES[-1][-1] += (end - begin).total_seconds() / NB_SIMULATIONS
-
-        pd.DataFrame(data=TIMES, columns=NB_ACCEPTORS, index=NB_PROPOSERS).to_csv('number_of_nodes_no_failure.csv')
+        cfgs = [
+            dict(nb_prop=nb_prop, nb_acc=nb_acc, period=PERIOD, seed=seed)
+            for nb_prop in NB_PROPOSERS for nb_acc in NB_ACCEPTORS for seed in range(NB_SIMULATIONS)
+        ]
+        T = run_grid(cfgs, (len(NB_PROPOSERS), len(NB_ACCEPTORS), NB_SIMULATIONS))
+        TIMES, STDS = T.mean(axis=-1), T.std(axis=-1, ddof=1)
+
+        save_results(pd.DataFrame(data=TIMES, columns=list(map(str, NB_ACCEPTORS)), index=NB_PROPOSERS), 'number_of_nodes_no_failure')
+        save_results(pd.DataFrame(data=STDS, columns=list(map(str, NB_ACCEPTORS)), index=NB_PROPOSERS), 'number_of_nodes_no_failure_std')
 
     fig, ax = plt.subplots(figsize=(7, 7))
-    sns.heatmap(data=TIMES, annot=True, fmt='.3g', cmap='seismic', square=True, ax=ax)
+    sns.heatmap(data=TIMES, annot=True, fmt='.3g', cmap='seismic', square=True, ax=ax, rasterized=True)
     ax.set_ylabel("Number of proposers")
     ax.set_yticklabels(NB_PROPOSERS)
     ax.invert_yaxis()
     ax.set_xlabel("Number of acceptors")
     ax.set_xticklabels(NB_ACCEPTORS)
     ax.set_title("Average time needed to reach consensus (seconds)")
-    fig.savefig('number_of_nodes_no_failure.png')
+    fig.savefig('number_of_nodes_no_failure.png', dpi=120)
 
 
 # Failure from the acceptors only
@@ -49,46 +59,35 @@ def acceptor_failure(precomputed=False):
     NB_ACCEPTORS = [1, 3, 5, 7, 9, 11, 13, 15, 17, 19]
     NB_SIMULATIONS = 10
     if precomputed:
-        TIMES = pd.read_csv('number_of_nodes_acceptor_failure.csv', index_col=0)
+        TIMES = load_results('number_of_nodes_acceptor_failure', index_col=0)
     else:
-        TIMES = []
-        for nb_prop in NB_PROPOSERS:
-            TIMES.append([])
-            for nb_acc in NB_ACCEPTORS:
-                TIMES[-1].append(0)
-                for _ in range(NB_SIMULATIONS):
-                    print(f" === NEW INSTANCE OF THE ALGORITHM ({nb_prop} PROPOSERS, {nb_acc} ACCEPTORS) === ")
-                    messenger = ReliableMessenger()
-                    assembly = Assembly(
-                        n_proposers=nb_prop, n_acceptors=nb_acc, messenger=messenger, acceptor_fail_rate=1e-7
-                    )
-                    for proposer in assembly.proposers:
-                        proposer.period = datetime.timedelta(seconds=10)
-                    begin = datetime.datetime.now()
-                    result = assembly.start()
-                    end = datetime.datetime.now()
-                    TIMES[-1][-1] += (end - begin).total_seconds() / NB_SIMULATIONS
-
-        TIMES = pd.DataFrame(data=TIMES, columns=NB_ACCEPTORS, index=NB_PROPOSERS)
-        TIMES.to_csv('number_of_nodes_acceptor_failure.csv')
+        cfgs = [
+            dict(nb_prop=nb_prop, nb_acc=nb_acc, acceptor_fail_rate=FAILURE_RATE, period=PERIOD, seed=seed)
+            for nb_prop in NB_PROPOSERS for nb_acc in NB_ACCEPTORS for seed in range(NB_SIMULATIONS)
+        ]
+        T = run_grid(cfgs, (len(NB_PROPOSERS), len(NB_ACCEPTORS), NB_SIMULATIONS))
+        TIMES, STDS = T.mean(axis=-1), T.std(axis=-1, ddof=1)
+
+        TIMES = pd.DataFrame(data=TIMES, columns=list(map(str, NB_ACCEPTORS)), index=NB_PROPOSERS)
+        save_results(TIMES, 'number_of_nodes_acceptor_failure')
+        save_results(pd.DataFrame(data=STDS, columns=list(map(str, NB_ACCEPTORS)), index=NB_PROPOSERS), 'number_of_nodes_acceptor_failure_std')
 
     fig, ax = plt.subplots(figsize=(7, 4))
-    sns.heatmap(data=TIMES, annot=True, fmt='.3g', cmap='seismic', square=True, ax=ax)
+    sns.heatmap(data=TIMES, annot=True, fmt='.3g', cmap='seismic', square=True, ax=ax, rasterized=True)
     ax.set_ylabel("Number of proposers")
     ax.set_yticklabels(NB_PROPOSERS)
     ax.invert_yaxis()
     ax.set_xlabel("Number of acceptors")
     ax.set_xticklabels(NB_ACCEPTORS)
     ax.set_title("Average time needed to reach consensus (seconds)")
-    fig.savefig('number_of_nodes_acceptor_failure.png')
+    fig.savefig('number_of_nodes_acceptor_failure.png', dpi=120)
 
-    TIMES['Proposers'] = TIMES.index.to_series()
-    TIMES = pd.melt(TIMES, id_vars=['Proposers'], value_vars=map(str, NB_ACCEPTORS), var_name='Acceptors', value_name='Time')
+    TIMES = long_form(TIMES, NB_PROPOSERS, NB_ACCEPTORS)
 
     fig, ax = plt.subplots(figsize=(6, 6))
     sns.lineplot(data=TIMES, x='Acceptors', y='Time', hue='Proposers', ax=ax)
     ax.set_title('Average time needed to achieve a consensus (seconds)')
-    fig.savefig('number_of_nodes_acceptor_failure_lineplot.png')
+    fig.savefig('number_of_nodes_acceptor_failure_lineplot.png', dpi=120)
 
 
 # Failure from the proposers only
@@ -97,46 +96,35 @@ def proposer_failure(precomputed=False):
     NB_ACCEPTORS = [1, 5, 10, 15, 20]
     NB_SIMULATIONS = 10
     if precomputed:
-        TIMES = pd.read_csv('number_of_nodes_proposer_failure.csv', index_col=0)
+        TIMES = load_results('number_of_nodes_proposer_failure', index_col=0)
     else:
-        TIMES = []
-        for nb_prop in NB_PROPOSERS:
-            TIMES.append([])
-            for nb_acc in NB_ACCEPTORS:
-                TIMES[-1].append(0)
-                for _ in range(NB_SIMULATIONS):
-                    print(f" === NEW INSTANCE OF THE ALGORITHM ({nb_prop} PROPOSERS, {nb_acc} ACCEPTORS) === ")
-                    messenger = ReliableMessenger()
-                    assembly = Assembly(
-                        n_proposers=nb_prop, n_acceptors=nb_acc, messenger=messenger, proposer_fail_rate=1e-7
-                    )
-                    for proposer in assembly.proposers:
-                        proposer.period = datetime.timedelta(seconds=10)
-                    begin = datetime.datetime.now()
-                    result = assembly.start()
-                    end = datetime.datetime.now()
-                    TIMES[-1][-1] += (end - begin).total_seconds() / NB_SIMULATIONS
-
-        TIMES = pd.DataFrame(data=TIMES, columns=NB_ACCEPTORS, index=NB_PROPOSERS)
-        TIMES.to_csv('number_of_nodes_acceptor_failure.csv')
+        cfgs = [
+            dict(nb_prop=nb_prop, nb_acc=nb_acc, proposer_fail_rate=FAILURE_RATE, period=PERIOD, seed=seed)
+            for nb_prop in NB_PROPOSERS for nb_acc in NB_ACCEPTORS for seed in range(NB_SIMULATIONS)
+        ]
+        T = run_grid(cfgs, (len(NB_PROPOSERS), len(NB_ACCEPTORS), NB_SIMULATIONS))
+        TIMES, STDS = T.mean(axis=-1), T.std(axis=-1, ddof=1)
+
+        TIMES = pd.DataFrame(data=TIMES, columns=list(map(str, NB_ACCEPTORS)), index=NB_PROPOSERS)
+        save_results(TIMES, 'number_of_nodes_proposer_failure')
+        save_results(pd.DataFrame(data=STDS, columns=list(map(str, NB_ACCEPTORS)), index=NB_PROPOSERS), 'number_of_nodes_proposer_failure_std')
 
     fig, ax = plt.subplots(figsize=(7, 7))
-    sns.heatmap(data=TIMES, annot=True, fmt='.3g', cmap='seismic', square=True, ax=ax)
+    sns.heatmap(data=TIMES, annot=True, fmt='.3g', cmap='seismic', square=True, ax=ax, rasterized=True)
     ax.set_ylabel("Number of proposers")
     ax.set_yticklabels(NB_PROPOSERS)
     ax.invert_yaxis()
     ax.set_xlabel("Number of acceptors")
     ax.set_xticklabels(NB_ACCEPTORS)
     ax.set_title("Average time needed to reach consensus (seconds)")
-    fig.savefig('number_of_nodes_proposer_failure.png')
+    fig.savefig('number_of_nodes_proposer_failure.png', dpi=120)
 
-    TIMES['Proposers'] = TIMES.index.to_series()
-    TIMES = pd.melt(TIMES, id_vars=['Proposers'], value_vars=map(str, NB_ACCEPTORS), var_name='Acceptors', value_name='Time')
+    TIMES = long_form(TIMES, NB_PROPOSERS, NB_ACCEPTORS)
 
     fig, ax = plt.subplots(figsize=(6, 6))
     sns.lineplot(data=TIMES, x='Proposers', y='Time', hue='Acceptors', ax=ax)
     ax.set_title('Average time needed to achieve a consensus (seconds)')
-    fig.savefig('number_of_nodes_proposer_failure_lineplot.png')
+    fig.savefig('number_of_nodes_proposer_failure_lineplot.png', dpi=120)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,148 @@
+import gc
+import hashlib
+import logging
+import os
+import pickle
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from paxos.basic_protocol import ReliableMessenger, UnreliableMessenger, Assembly
+
+logger = logging.getLogger(__name__)
+
+# Every simulated (proposers, acceptors, failure rates, seed) cell is stored in its own file,
+#  so that an interrupted sweep can be resumed and a single cell can be refreshed on its own.
+# Delete this directory to invalidate the cache.
+CACHE_DIR = Path('.cache/cells')
+# Below this number of simulations, starting a pool of processes costs more than it saves
+PARALLEL_THRESHOLD = 8
+
+
+class Simulation:
+    # Class simulation to run a simulation
+
+    def __init__(self,
+                 n_proposers: int,
+                 n_acceptors: int,
+                 messenger_failure_rate: Optional[float] = 0,
+                 proposer_fail_rate=0,
+                 acceptor_fail_rate=0,
+                 messenger_max_delay=0.5,
+                 period_proposer: Optional[timedelta] = None
+                 ):
+        # A messenger failure rate of None stands for a reliable messenger
+        if messenger_failure_rate is None:
+            self.messenger = ReliableMessenger()
+        else:
+            self.messenger = UnreliableMessenger(failure_rate=messenger_failure_rate,
+                                                 max_delay=messenger_max_delay)
+        if period_proposer is None:
+            period_proposer = timedelta(seconds=messenger_max_delay*18 + 5)  # The 18 from page 13-14 of Leslie Lamport Part-Time Parliament paper
+        self.assembly = Assembly(n_proposers=n_proposers,
+                                 n_acceptors=n_acceptors,
+                                 messenger=self.messenger,
+                                 proposer_fail_rate=proposer_fail_rate,
+                                 acceptor_fail_rate=acceptor_fail_rate,
+                                 period_proposer=period_proposer)
+
+    def start(self):
+        # Messages, votes and ballots hold no reference cycle, they are freed as soon as they are processed: the cyclic
+        #  garbage collector is disabled during the run, like `timeit' does, so that it does not keep scanning them
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start_time = time.perf_counter()
+            result = self.assembly.start()
+            time_measured = time.perf_counter() - start_time
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        logger.info("Consensus reached on %s", result)
+        return time_measured
+
+
+@lru_cache(maxsize=1)
+def _simulation(nb_prop: int, nb_acc: int, msg_fail_rate: Optional[float], proposer_fail_rate: float,
+                acceptor_fail_rate: float, max_delay: float, period: Optional[float]) -> Simulation:
+    """Returns the simulation of a cell, which is kept and reset between two seeds instead of being built again."""
+    return Simulation(
+        n_proposers=nb_prop, n_acceptors=nb_acc, messenger_failure_rate=msg_fail_rate,
+        proposer_fail_rate=proposer_fail_rate, acceptor_fail_rate=acceptor_fail_rate,
+        messenger_max_delay=max_delay, period_proposer=None if period is None else timedelta(seconds=period)
+    )
+
+
+@lru_cache(maxsize=1024)
+def run_one(nb_prop: int, nb_acc: int, msg_fail_rate: Optional[float] = None,
+            proposer_fail_rate: float = 0, acceptor_fail_rate: float = 0,
+            max_delay: float = 0, period: Optional[float] = None, seed: int = 0) -> float:
+    """Returns the time needed to reach consensus in one cell of a sweep, simulating it only if it is not cached yet."""
+    key = repr((nb_prop, nb_acc, msg_fail_rate, proposer_fail_rate, acceptor_fail_rate, max_delay, period, seed))
+    path = CACHE_DIR / f'{hashlib.blake2b(key.encode(), digest_size=16).hexdigest()}.pkl'
+    if path.exists():
+        with path.open('rb') as f:
+            return pickle.load(f)
+
+    logger.info("New instance of the algorithm (%d proposers, %d acceptors)", nb_prop, nb_acc)
+    simul = _simulation(nb_prop, nb_acc, msg_fail_rate, proposer_fail_rate, acceptor_fail_rate, max_delay, period)
+    simul.assembly.reset()
+    if isinstance(simul.messenger, UnreliableMessenger):
+        simul.messenger.seed(seed)
+    # Agents draw their quorums and failures from the global generator. The draws are seeded, but the simulation follows
+    #  the clock of the loop, so the time measured still varies from one run of a cell to the next
+    random.seed(seed)
+    time_measured = simul.start()
+
+    # The result is written aside then renamed, so that an interruption never leaves a truncated cell behind
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    with tmp.open('wb') as f:
+        pickle.dump(time_measured, f)
+    tmp.replace(path)
+    return time_measured
+
+
+def _one_run(cfg: dict) -> float:
+    """Runs one cell of a sweep inside a worker process."""
+    return run_one(**cfg)
+
+
+def run_many(cfgs: List[dict]) -> List[float]:
+    """Runs the simulations described by the keyword arguments of `run_one', in parallel when there are enough."""
+    if len(cfgs) < PARALLEL_THRESHOLD:
+        return [run_one(**cfg) for cfg in cfgs]
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        return list(executor.map(_one_run, cfgs, chunksize=4))
+
+
+def run_grid(cfgs: List[dict], shape: Tuple[int, ...]) -> np.ndarray:
+    """Runs the simulations and arranges their times in an array of the given shape, in the order of `cfgs'."""
+    return np.array(run_many(cfgs), dtype=np.float64).reshape(shape)
+
+
+def save_results(data: pd.DataFrame, stem: str, index: bool = True) -> None:
+    """Saves the results of an experiment to `stem'.parquet, along with a CSV mirror."""
+    try:
+        data.to_parquet(f'{stem}.parquet', index=index)
+    except ImportError:
+        # Parquet needs pyarrow, without it the CSV mirror is all there is
+        pass
+    data.to_csv(f'{stem}.csv', index=index, float_format='%.6g')
+
+
+def load_results(stem: str, index_col: Optional[int] = None) -> pd.DataFrame:
+    """Loads the results of an experiment, from parquet when they were saved as such."""
+    if Path(f'{stem}.parquet').exists():
+        try:
+            return pd.read_parquet(f'{stem}.parquet')
+        except ImportError:
+            pass
+    return pd.read_csv(f'{stem}.csv', index_col=index_col)
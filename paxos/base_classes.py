@@ -1,55 +1,176 @@
 from __future__ import annotations
 
 import asyncio
-from threading import Event
-from time import sleep
+import logging
+import math
+from collections import deque
 from abc import ABC, abstractmethod
-from enum import Enum, auto
-from typing import Any, Set, Optional
-from dataclasses import dataclass
-from numpy.random import random, exponential
+from enum import IntEnum
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from dataclasses import dataclass, field
+from functools import lru_cache
+from random import expovariate
+from time import monotonic
+from numpy.random import default_rng
+
+logger = logging.getLogger(__name__)
+
+# The messenger draws its random numbers by batches of this size
+RANDOM_BUFFER_SIZE = 65536
+# When the messages outnumber the expected count, the batch of delivery decisions doubles, up to this size
+MAX_DELIVERY_BUFFER_SIZE = 1 << 20
+# Delayed messages due within the same tick of this length (in seconds) are delivered together, by a single timer
+DELIVERY_TICK = 0.01
 
 
 # Dataclasses
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Proposal:
     value: Any
 
 
-@dataclass(order=True)
+@dataclass(frozen=True, slots=True)
 class BallotNumber:
     ballot_id: int
     agent_id: int
+    # Both ids packed in a single integer, so that comparing two ballot numbers is a single integer comparison
+    key: int = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, 'key', self.ballot_id << 32 | self.agent_id)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, BallotNumber):
+            return NotImplemented
+        return self.key == other.key
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def __lt__(self, other: BallotNumber) -> bool:
+        return self.key < other.key
+
+    def __le__(self, other: BallotNumber) -> bool:
+        return self.key <= other.key
+
+    def __gt__(self, other: BallotNumber) -> bool:
+        return self.key > other.key
+
+    def __ge__(self, other: BallotNumber) -> bool:
+        return self.key >= other.key
+
+
+# Proposals and ballot numbers are immutable, equal ones are shared instead of being allocated again and again
+@lru_cache(maxsize=4096)
+def intern_proposal(value: Any) -> Proposal:
+    return Proposal(value)
+
+
+@lru_cache(maxsize=4096)
+def intern_ballot_number(ballot_id: int, agent_id: int) -> BallotNumber:
+    return BallotNumber(ballot_id, agent_id)
+
+
+# The decree of a ballot whose proposer has not chosen one yet, shared by all of them
+NO_PROPOSAL = intern_proposal(None)
+
+
+# Sets of agents (quorums, voters) are represented as integers whose bits are set at the ids of their members
+def bitmask(agents) -> int:
+    """Returns the bitmask representing a set of agents."""
+    mask = 0
+    for agent in agents:
+        mask |= 1 << agent.id
+    return mask
 
 
-@dataclass(order=True)
+def agent_ids(mask: int) -> List[int]:
+    """Returns the ids of the agents in a bitmask."""
+    ids = []
+    while mask:
+        lowest = mask & -mask
+        ids.append(lowest.bit_length() - 1)
+        mask ^= lowest
+    return ids
+
+
+# Ballots and votes are only compared through their numbers, comparing their other fields would be wasted work
+@dataclass(slots=True)
 class Ballot:
     number: BallotNumber
     decree: Proposal
-    quorum: Set[Agent]
-    voters: Set[Agent]
+    quorum: int
+    voters: int
+    # Number of members of the quorum, which is fixed once the ballot is created
+    quorum_size: int = field(init=False, repr=False)
+    # Members of the quorum who did not vote yet, kept up to date by `add_voter'
+    _missing: int = field(init=False, repr=False)
+
+    def __lt__(self, other: Ballot) -> bool:
+        return self.number < other.number
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Ballot):
+            return NotImplemented
+        return self.number == other.number
+
+    def __hash__(self) -> int:
+        return hash(self.number)
+
+    def __post_init__(self):
+        self.quorum_size = self.quorum.bit_count()
+        self._missing = self.quorum & ~self.voters
+
+    def add_voter(self, agent_id: int) -> None:
+        bit = 1 << agent_id
+        self.voters |= bit
+        self._missing &= ~bit
 
     @property
     def successful(self) -> bool:
-        return self.quorum.issubset(self.voters)
+        return not self._missing
 
 
-@dataclass
+@dataclass(slots=True)
 class Vote:
     ballot: Ballot
-    acceptor: Agent
+    # Only the id of the acceptor travels with its vote, like the members of quorums
+    acceptor_id: int
+
+    def _key(self):
+        return self.ballot.number, self.acceptor_id
+
+    def __lt__(self, other: Vote) -> bool:
+        return self._key() < other._key()
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Vote):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
 
 
 # Messages
-class MessageType(Enum):
-    NextBallot = auto()
-    LastVote = auto()
-    BeginBallot = auto()
-    Voted = auto()
-    Success = auto()
+# Types are numbered from 0, so that they index the handler tables of the agents
+class MessageType(IntEnum):
+    NextBallot = 0
+    LastVote = 1
+    BeginBallot = 2
+    Voted = 3
+    Success = 4
+
 
+def handler_table(handlers: Dict[MessageType, Callable]) -> List[Optional[Callable]]:
+    """Returns the handlers indexed by the types of messages they handle, None for the types that are ignored."""
+    table: List[Optional[Callable]] = [None] * len(MessageType)
+    for message_type, handler in handlers.items():
+        table[message_type] = handler
+    return table
 
-@dataclass()
+
+@dataclass(slots=True)
 class Message:
     author_id: int
     type: MessageType
@@ -64,6 +185,78 @@ class Message:
     # For Voted
     vote: Optional[Vote] = None
 
+    # Each type of message is built by its own factory, which passes every field by position: keyword arguments
+    #  would make `__init__' match them by name, for every message sent
+    @classmethod
+    def make_next_ballot(cls, author_id: int, ballot_number: BallotNumber) -> Message:
+        return cls(author_id, MessageType.NextBallot, ballot_number)
+
+    @classmethod
+    def make_last_vote(cls, author_id: int, ballot_number: BallotNumber, last_vote: Optional[Vote]) -> Message:
+        return cls(author_id, MessageType.LastVote, ballot_number, last_vote)
+
+    @classmethod
+    def make_begin_ballot(cls, author_id: int, ballot: Ballot, decree: Proposal) -> Message:
+        return cls(author_id, MessageType.BeginBallot, None, None, ballot, decree)
+
+    @classmethod
+    def make_voted(cls, author_id: int, vote: Vote) -> Message:
+        return cls(author_id, MessageType.Voted, None, None, None, None, vote)
+
+    @classmethod
+    def make_success(cls, author_id: int, decree: Proposal, ballot_number: Optional[BallotNumber] = None) -> Message:
+        return cls(author_id, MessageType.Success, ballot_number, None, None, decree)
+
+
+def _wake_up(waiter: Optional[asyncio.Future]) -> None:
+    if waiter is not None and not waiter.done():
+        waiter.set_result(None)
+
+
+class Mailbox:
+    """The messages delivered to an agent, in the order they arrived, which the agent can wait for."""
+    __slots__ = ('_messages', '_waiter')
+
+    def __init__(self):
+        self._messages = deque()
+        # The future the agent is waiting on while its mailbox is empty
+        self._waiter: Optional[asyncio.Future] = None
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def put(self, message: Message) -> None:
+        self._messages.append(message)
+        _wake_up(self._waiter)
+
+    def put_many(self, messages: List[Message]) -> None:
+        self._messages.extend(messages)
+        if messages:
+            _wake_up(self._waiter)
+
+    def drain(self) -> List[Message]:
+        """Takes out every message at once."""
+        messages = list(self._messages)
+        self._messages.clear()
+        return messages
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Message]:
+        """Takes out the oldest message, waiting for one if the mailbox is empty, or None after `timeout' seconds."""
+        if not self._messages:
+            loop = asyncio.get_running_loop()
+            self._waiter = waiter = loop.create_future()
+            # The same future is woken up by the first message or by the timer, whichever comes first
+            timer = None if timeout is None else loop.call_later(timeout, _wake_up, waiter)
+            try:
+                await waiter
+            finally:
+                self._waiter = None
+                if timer is not None:
+                    timer.cancel()
+            if not self._messages:
+                return None
+        return self._messages.popleft()
+
 
 class Messenger(ABC):
     @abstractmethod
@@ -76,125 +269,314 @@ class Messenger(ABC):
         """Sends a message to an agent."""
         pass
 
+    def send_broadcast(self, ids: Iterable[int], message: Message) -> None:
+        """Sends the same message to several agents."""
+        for id_ in ids:
+            self.send_message(id_, message)
+
+    def send_many(self, id_: int, messages: List[Message]) -> None:
+        """Sends several messages to an agent, in order."""
+        for message in messages:
+            self.send_message(id_, message)
+
+    @abstractmethod
+    async def get_message(self, id_: int, timeout: Optional[float] = None) -> Optional[Message]:
+        """Allows an agent to get a message that was sent to them, waiting for one if there is none yet.
+        If no message arrives within `timeout' seconds, None is returned instead."""
+        pass
+
+    @abstractmethod
+    def get_messages(self, id_: int) -> List[Message]:
+        """Allows an agent to get all the messages that were sent to them at once."""
+        pass
+
     @abstractmethod
-    def get_message(self, id_: int) -> Optional[Message]:
-        """Allows an agent to get a message that was sent to them."""
+    def reset(self) -> None:
+        """Forgets every agent and message, so that the messenger can serve a new simulation."""
         pass
 
 
+def _register(delivered: List[Optional[Mailbox]], agent_id: int) -> None:
+    # Mailboxes are indexed by the ids of their agents, which assemblies number from 0
+    if agent_id >= len(delivered):
+        delivered.extend([None] * (agent_id + 1 - len(delivered)))
+    delivered[agent_id] = Mailbox()
+
+
 class ReliableMessenger(Messenger):
     def __init__(self):
-        self.delivered = dict()
+        self.delivered: List[Optional[Mailbox]] = []
 
     def register(self, agent_id: int) -> None:
         """Registers a new agent so that any agent can send message to them."""
-        self.delivered[agent_id] = []
+        _register(self.delivered, agent_id)
 
     def send_message(self, dest_id: int, message: Message) -> None:
         """Sends a message to an agent."""
-        if dest_id in self.delivered:
-            self.delivered[dest_id].append(message)
-
-    def get_message(self, dest_id: int) -> Optional[Message]:
-        """Allows an agent to get a message that was sent to them."""
-        if self.delivered[dest_id]:
-            return self.delivered[dest_id].pop(0)
-        else:
-            return None
+        # Messages to agents that are not registered are simply dropped
+        delivered = self.delivered
+        inbox = delivered[dest_id] if dest_id < len(delivered) else None
+        if inbox is not None:
+            inbox.put(message)
+
+    def send_broadcast(self, ids: Iterable[int], message: Message) -> None:
+        """Sends the same message to several agents."""
+        delivered = self.delivered
+        nb_boxes = len(delivered)
+        for dest_id in ids:
+            inbox = delivered[dest_id] if dest_id < nb_boxes else None
+            if inbox is not None:
+                inbox.put(message)
+
+    def send_many(self, dest_id: int, messages: List[Message]) -> None:
+        """Sends several messages to an agent, in order."""
+        delivered = self.delivered
+        inbox = delivered[dest_id] if dest_id < len(delivered) else None
+        if inbox is not None:
+            inbox.put_many(messages)
+
+    async def get_message(self, dest_id: int, timeout: Optional[float] = None) -> Optional[Message]:
+        """Allows an agent to get a message that was sent to them, waiting for one if there is none yet.
+        If no message arrives within `timeout' seconds, None is returned instead."""
+        return await self.delivered[dest_id].get(timeout)
+
+    def get_messages(self, dest_id: int) -> List[Message]:
+        """Allows an agent to get all the messages that were sent to them at once."""
+        return self.delivered[dest_id].drain()
+
+    def reset(self) -> None:
+        """Forgets every agent and message, so that the messenger can serve a new simulation."""
+        self.delivered.clear()
 
 
 class UnreliableMessenger(Messenger):
-    def __init__(self, failure_rate: float = 0, max_delay: float = 10):
+    def __init__(self, failure_rate: float = 0, max_delay: float = 10,
+                 expected_messages: int = RANDOM_BUFFER_SIZE, seed: Optional[int] = None):
         self.failure_rate = failure_rate
         self.max_delay = max_delay
-
-        self.delivered = dict()
-        self.to_deliver = dict()
+        self.expected_messages = expected_messages
+
+        self.delivered: List[Optional[Mailbox]] = []
+        # Without any delay, messages are delivered as soon as they are sent, without scheduling anything
+        self._zero_delay = max_delay == 0
+        # Without any failure, no message has to be checked before being delivered
+        self._lossless = failure_rate == 0
+        # The messages due at each tick, the timers that deliver them, and the loop whose clock the ticks were counted on
+        self._buckets = dict()
+        self._timers = dict()
+        self._buckets_loop = None
+
+        self.seed(seed)
+
+    def seed(self, seed: Optional[int] = None) -> None:
+        """Seeds the random numbers of the messenger, so that which messages are lost can be reproduced."""
+        # Drawing random numbers one at a time is costly, they are drawn by batches and consumed one by one
+        self._rng = default_rng(seed)
+        # Whether each message will be delivered is decided in advance, for the number of messages expected
+        self._deliveries = (self._rng.random(self.expected_messages) > self.failure_rate).tolist()
+        self._delivery_idx = 0
+        self._exponentials = self._rng.exponential(size=RANDOM_BUFFER_SIZE).tolist()
+        self._exponential_idx = 0
 
     def register(self, agent_id: int):
         """Registers a new agent so that any other agent can send message to them."""
-        self.to_deliver[agent_id] = []
-        self.delivered[agent_id] = []
+        _register(self.delivered, agent_id)
 
     def send_message(self, dest_id: int, message: Message) -> None:
         """Sends a message to an agent."""
-        if dest_id in self.to_deliver and random() > self.failure_rate:
-            self.to_deliver[dest_id].append(message)
-        else:
-            print(f"Agent #{message.author_id} failed to message agent #{dest_id}")
-
-    def get_message(self, dest_id) -> Optional[Message]:
-        """Allows an agent to get a message that was sent to them."""
-        if self.delivered[dest_id]:
-            return self.delivered[dest_id].pop(0)
+        delivered = self.delivered
+        inbox = delivered[dest_id] if dest_id < len(delivered) else None
+        if inbox is not None and (self._lossless or self._next_delivery()):
+            if self._zero_delay:
+                inbox.put(message)
+                return
+            # The delay is drawn once and for all when the message is sent
+            delay = min(self.max_delay, self.max_delay * self._next_exponential() / 2)
+            # Messages are sent by the agents, from within the loop of the simulation: the delivery is scheduled on it
+            #  and dropped with it if the simulation ends first
+            self._schedule(asyncio.get_running_loop(), delay, dest_id, message)
+        elif logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Agent #%d failed to message agent #%d", message.author_id, dest_id)
+
+    def send_broadcast(self, ids: Iterable[int], message: Message) -> None:
+        """Sends the same message to several agents."""
+        # Each copy of the message is lost or delayed on its own, but the loop is looked up once for all of them
+        loop = None if self._zero_delay else asyncio.get_running_loop()
+        delivered = self.delivered
+        nb_boxes = len(delivered)
+        for dest_id in ids:
+            inbox = delivered[dest_id] if dest_id < nb_boxes else None
+            if inbox is None or not (self._lossless or self._next_delivery()):
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Agent #%d failed to message agent #%d", message.author_id, dest_id)
+            elif loop is None:
+                inbox.put(message)
+            else:
+                delay = min(self.max_delay, self.max_delay * self._next_exponential() / 2)
+                self._schedule(loop, delay, dest_id, message)
+
+    def send_many(self, dest_id: int, messages: List[Message]) -> None:
+        """Sends several messages to an agent, in order."""
+        if self._lossless and self._zero_delay:
+            delivered = self.delivered
+            inbox = delivered[dest_id] if dest_id < len(delivered) else None
+            if inbox is not None:
+                inbox.put_many(messages)
         else:
-            return None
-
-    async def deliver_message(self, dest_id: int, message: Message):
-        """Delivers a message: transfers it from `to_deliver' to `delivered'."""
-        # print(f"[Messenger] [{datetime.now()}] Debut du transfert :", message)
-        delay = min(self.max_delay, self.max_delay * exponential() / 2)
-        await asyncio.sleep(delay)
-        self.delivered[dest_id].append(message)
-        try:
-            self.to_deliver[dest_id].remove(message)
-        except ValueError:
-            # This error can be raised if the addressee restarts, which empties its message lists
-            pass
-        # print(f"[Messenger] [{datetime.now()}] Fin du transfert :", message)
-
-    async def _start(self, event: Event):
-        while not event.is_set():
-            if sum(self.to_deliver.values(), []):
-                to_do = []
-                for dest_id in self.to_deliver.copy():
-                    for message in self.to_deliver[dest_id]:
-                        to_do.append(self.deliver_message(dest_id, message))
-                await asyncio.gather(*to_do)
-
-    def start(self, event: Event):
-        loop = asyncio.new_event_loop()
-        loop.run_until_complete(self._start(event))
-        loop.close()
+            # Each message is lost or delayed on its own
+            for message in messages:
+                self.send_message(dest_id, message)
+
+    def _schedule(self, loop: asyncio.AbstractEventLoop, delay: float, dest_id: int, message: Message) -> None:
+        # Buckets left over by a previous simulation were never delivered, they belong to a loop that is gone
+        if loop is not self._buckets_loop:
+            self._drop_buckets()
+            self._buckets_loop = loop
+        tick = math.ceil((loop.time() + delay) / DELIVERY_TICK)
+        bucket = self._buckets.get(tick)
+        if bucket is None:
+            # The first message due at this tick sets the timer, the next ones join it
+            bucket = self._buckets[tick] = []
+            self._timers[tick] = loop.call_at(tick * DELIVERY_TICK, self._deliver_bucket, tick)
+        bucket.append((dest_id, message))
+
+    def _deliver_bucket(self, tick: int) -> None:
+        del self._timers[tick]
+        for dest_id, message in self._buckets.pop(tick):
+            self.deliver_message(dest_id, message)
+
+    def _drop_buckets(self) -> None:
+        # The timers are cancelled along with their buckets, so that none of them fires on a reset messenger
+        for timer in self._timers.values():
+            timer.cancel()
+        self._buckets = dict()
+        self._timers = dict()
+
+    def _next_delivery(self) -> bool:
+        deliveries, i = self._deliveries, self._delivery_idx
+        if i >= len(deliveries):
+            # An empty batch, when no message was expected, is redrawn at the size of the other buffers
+            size = min(max(2 * len(deliveries), RANDOM_BUFFER_SIZE), MAX_DELIVERY_BUFFER_SIZE)
+            deliveries = self._deliveries = (self._rng.random(size) > self.failure_rate).tolist()
+            i = 0
+        self._delivery_idx = i + 1
+        return deliveries[i]
+
+    def _next_exponential(self) -> float:
+        i = self._exponential_idx
+        if i >= RANDOM_BUFFER_SIZE:
+            self._exponentials = self._rng.exponential(size=RANDOM_BUFFER_SIZE).tolist()
+            i = 0
+        self._exponential_idx = i + 1
+        return self._exponentials[i]
+
+    async def get_message(self, dest_id: int, timeout: Optional[float] = None) -> Optional[Message]:
+        """Allows an agent to get a message that was sent to them, waiting for one if there is none yet.
+        If no message arrives within `timeout' seconds, None is returned instead."""
+        return await self.delivered[dest_id].get(timeout)
+
+    def get_messages(self, dest_id: int) -> List[Message]:
+        """Allows an agent to get all the messages that were sent to them at once."""
+        return self.delivered[dest_id].drain()
+
+    def deliver_message(self, dest_id: int, message: Message):
+        """Delivers a message once its delay has elapsed."""
+        self.delivered[dest_id].put(message)
+
+    def reset(self) -> None:
+        """Forgets every agent and message, so that the messenger can serve a new simulation."""
+        self.delivered.clear()
+        self._drop_buckets()
+        self._buckets_loop = None
 
 
 class Agent(ABC):
     counter = 0
 
-    def __init__(self, messenger: Messenger, failure_rate: float = 0, avg_failure_duration: float = 5):
+    def __init__(self, messenger: Messenger, failure_rate: float = 0, avg_failure_duration: float = 5,
+                 agent_id: Optional[int] = None):
         self.ledger = None
         self.messenger = messenger
+        # Average number of failures per second the agent is up, and average number of seconds each failure lasts
         self.failure_rate = failure_rate
         self.avg_failure_duration = avg_failure_duration
+        # The bound handler of each type of message, filled in by subclasses for the types they react to
+        self._handlers: List[Optional[Callable]] = handler_table({})
 
-        self.id = Agent.counter
-        Agent.counter += 1
+        # Assemblies number their agents from 0, agents created on their own are counted globally
+        if agent_id is None:
+            agent_id = Agent.counter
+            Agent.counter += 1
+        self.id = agent_id
 
     def __repr__(self):
         return f'Agent #{self.id}'
 
-    def start(self, event: Event) -> None:
-        print(f"Agent #{self.id} started ({self.__class__.__name__})")
+    async def run(self, event: asyncio.Event) -> None:
+        # Whenever the agent fails, it starts again once it recovers
+        while not event.is_set():
+            await self._run_once(event)
+
+    async def _run_once(self, event: asyncio.Event) -> None:
+        """Runs the agent from the moment it starts until it fails or the simulation ends."""
+        logger.debug("Agent #%d started (%s)", self.id, self.__class__.__name__)
         self.messenger.register(self.id)
+        fail_at = self._draw_failure_time()
         while not event.is_set():
-            # Process messages received
-            message = self.messenger.get_message(self.id)
-            if message is not None:
-                self.process_message(message)
-            # And maybe fail
-            if random() < self.failure_rate:
-                print(f"Agent #{self.id} failed ({self.__class__.__name__})")
-                sleep(self.avg_failure_duration * exponential())
+            # The agent has nothing to do until it receives a message or fails
+            messages = await self._wait_for_messages(fail_at)
+            if messages:
+                self.process_message_batch(messages)
+            if monotonic() >= fail_at:
+                await self._fail()
                 break
 
-        # If the agent failed, it starts again
-        if not event.is_set():
-            self.start(event)
+    def _draw_failure_time(self) -> float:
+        """Returns the moment the agent will fail, which is infinitely far away if it cannot fail."""
+        if not self.failure_rate:
+            return math.inf
+        # Failures come at `failure_rate' per second: how long the agent stays up is drawn once, when it starts
+        return monotonic() + expovariate(self.failure_rate)
+
+    async def _wait_for_messages(self, deadline: float) -> List[Message]:
+        """Takes out every message received, waiting for one until `deadline' if there is none yet."""
+        messages = self.messenger.get_messages(self.id)
+        if messages:
+            return messages
+        timeout = None if deadline == math.inf else max(deadline - monotonic(), 0)
+        message = await self.messenger.get_message(self.id, timeout)
+        if message is None:
+            return []
+        return [message] + self.messenger.get_messages(self.id)
+
+    async def _fail(self) -> None:
+        """Keeps the agent down for as long as its failure lasts."""
+        logger.debug("Agent #%d failed (%s)", self.id, self.__class__.__name__)
+        await asyncio.sleep(self.avg_failure_duration * expovariate(1))
 
-    @abstractmethod
     def process_message(self, message: Message) -> None:
-        pass
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Agent #%d received a %s message from agent #%d", self.id, message.type.name, message.author_id)
+        handler = self._handlers[message.type]
+        if handler is not None:
+            handler(message)
+
+    def process_message_batch(self, messages: List[Message]) -> None:
+        """Processes, in order, all the messages received since the last time the agent checked."""
+        for message in messages:
+            self.process_message(message)
+
+    def reset(self) -> None:
+        """Forgets everything the agent learnt, so that it can take part in a new simulation."""
+        self.ledger = None
 
     def on_success(self, message) -> None:
-        print(f"Agent #{self.id} was notified that decree {message.decree} was accepted.")
+        logger.debug("Agent #%d was notified that decree %s was accepted.", self.id, message.decree)
+        learnt = self.ledger is None
         self.ledger = message.decree
+        if learnt:
+            self.on_learnt()
+
+    def on_learnt(self) -> None:
+        """Called once, when the agent first learns which decree was accepted."""
+        pass
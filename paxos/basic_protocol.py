@@ -1,194 +1,225 @@
 from __future__ import annotations
-from threading import Thread, Event
-from datetime import timedelta, datetime
+import asyncio
+import logging
+from datetime import timedelta
+from time import monotonic
 from typing import List, Optional
-from numpy.random import choice
+from random import sample
 
 from paxos.base_classes import *
 
+logger = logging.getLogger(__name__)
+
 
 class Proposer(Agent):
     def __init__(self, messenger: Messenger, assembly: Assembly,
                  failure_rate: float = 0, avg_failure_duration: float = 5,
-                 period: timedelta = timedelta(seconds=60)
+                 period: timedelta = timedelta(seconds=60), agent_id: Optional[int] = None
                  ):
-        super().__init__(messenger, failure_rate=failure_rate, avg_failure_duration=avg_failure_duration)
+        super().__init__(messenger, failure_rate=failure_rate, avg_failure_duration=avg_failure_duration,
+                         agent_id=agent_id)
         self.period = period
         self.assembly = assembly
+        self._handlers = handler_table({
+            MessageType.LastVote: self.on_lastvote,
+            MessageType.Voted: self.on_voted,
+            MessageType.Success: self.on_success,
+        })
         self.last_tried: Optional[Ballot] = None
-        self.responses: List[Optional[Vote]] = list()
-
-    def start(self, event: Event) -> None:
-        t0 = datetime.now() - self.period + timedelta(seconds=5)
-        print(f"Agent #{self.id} started ({self.__class__.__name__})")
+        # The LastVote responses to the current ballot are counted, only the highest vote they carry is kept
+        self.nb_responses = 0
+        self.best_vote: Optional[Vote] = None
+
+    async def _run_once(self, event: asyncio.Event) -> None:
+        period = self.period.total_seconds()
+        # The first ballot is initiated 5 seconds after the proposer starts, then one every period
+        next_ballot_at = monotonic() + 5
+        logger.debug("Agent #%d started (%s)", self.id, self.__class__.__name__)
         self.messenger.register(self.id)
+        fail_at = self._draw_failure_time()
         while not event.is_set():
-            # Process messages received
-            message = self.messenger.get_message(self.id)
-            if message is not None:
-                self.process_message(message)
+            # A proposer has nothing to do until it gets a message, its next ballot is due or it fails
+            messages = await self._wait_for_messages(min(next_ballot_at, fail_at))
+            if messages:
+                self.process_message_batch(messages)
+            now = monotonic()
             # Regularly initiate ballots
-            if datetime.now() - t0 >= self.period:
-                t0 = datetime.now()
+            if now >= next_ballot_at:
+                next_ballot_at = now + period
                 self.initiate_new_ballot()
             # And maybe fail
-            if random() < self.failure_rate:
-                print(f"Agent #{self.id} failed ({self.__class__.__name__})")
-                sleep(self.avg_failure_duration * exponential())
+            if now >= fail_at:
+                await self._fail()
                 break
 
-        # If the agent failed, it starts again
-        if not event.is_set():
-            self.start(event)
-
-    def process_message(self, message: Message):
-        print(f"Agent #{self.id} received a {message.type} message from agent #{message.author_id}")
-        if message.type is MessageType.LastVote:
-            self.on_lastvote(message)
-        elif message.type is MessageType.Voted:
-            self.on_voted(message)
-        elif message.type is MessageType.Success:
-            self.on_success(message)
+    def reset(self) -> None:
+        super().reset()
+        self.last_tried = None
+        self.nb_responses = 0
+        self.best_vote = None
 
     def on_lastvote(self, message: Message):
-        if message.ballot_number == self.last_tried.number:
-            self.responses.append(message.last_vote)
+        ballot = self.last_tried
+        if message.ballot_number == ballot.number:
+            self.nb_responses += 1
+            vote, best = message.last_vote, self.best_vote
+            if vote is not None and (best is None or vote.ballot.number > best.ballot.number):
+                best = self.best_vote = vote
             # If all responses are received
-            if len(self.responses) == len(self.last_tried.quorum):
-                # Sets the decree to satisfy B3
-                ballots = [v.ballot for v in self.responses if v is not None]
-                ballot_numbers = [b.number for b in ballots]
-                if ballots:
-                    max_number = max(ballot_numbers)
-                    max_ballot = [b for b in ballots if b.number == max_number][0]
-                    self.last_tried.decree = max_ballot.decree
+            if self.nb_responses == ballot.quorum_size:
+                # Sets the decree to satisfy B3: the decree of the highest ballot any acceptor of the quorum voted for
+                if best is not None:
+                    ballot.decree = best.ballot.decree
                 else:
-                    self.last_tried.decree = self.make_proposal()
+                    ballot.decree = self.make_proposal()
 
                 # Sends the BeginBallot message
-                reponse = Message(
-                    author_id=self.id,
-                    type=MessageType.BeginBallot,
-                    ballot=self.last_tried,
-                    decree=self.last_tried.decree,
-                )
-                for acceptor in self.last_tried.quorum:
-                    self.messenger.send_message(acceptor.id, reponse)
+                reponse = Message.make_begin_ballot(self.id, ballot, ballot.decree)
+                self.messenger.send_broadcast(agent_ids(ballot.quorum), reponse)
 
     def on_voted(self, message: Message):
         # When the proposer receives a vote regarding its current ballot
-        if message.vote.ballot.number == self.last_tried.number:
+        ballot = self.last_tried
+        if message.vote.ballot.number == ballot.number:
             # It adds one voter
-            self.last_tried.voters.add(message.vote.acceptor)
+            ballot.add_voter(message.vote.acceptor_id)
             # If the ballot becomes successful
-            if self.last_tried.successful:
+            if ballot.successful:
                 # It sends a message to the whole assembly
-                response = Message(author_id=self.id, type=MessageType.Success, decree=self.last_tried.decree)
-                for agent in self.assembly.agents:
-                    self.messenger.send_message(agent.id, response)
+                response = Message.make_success(self.id, ballot.decree)
+                self.messenger.send_broadcast(self.assembly.all_agent_ids, response)
 
     def initiate_new_ballot(self):
         if self.last_tried is None:
-            b = BallotNumber(0, self.id)
+            b = intern_ballot_number(0, self.id)
         else:
-            b = BallotNumber(self.last_tried.number.ballot_id + 1, self.id)
+            b = intern_ballot_number(self.last_tried.number.ballot_id + 1, self.id)
         quorum = self.create_random_quorum()
-        print(f'{self} selected the following quorum : {quorum}')
-        self.last_tried = Ballot(b, Proposal(None), quorum, set())
-        self.responses = list()
-
-        message = Message(
-            author_id=self.id,
-            type=MessageType.NextBallot,
-            ballot_number=self.last_tried.number,
-        )
-        for acceptor in self.last_tried.quorum:
-            self.messenger.send_message(acceptor.id, message)
+        logger.debug("%s selected the following quorum : %s", self, quorum)
+        self.last_tried = Ballot(b, NO_PROPOSAL, bitmask(quorum), 0)
+        self.nb_responses = 0
+        self.best_vote = None
+
+        message = Message.make_next_ballot(self.id, self.last_tried.number)
+        self.messenger.send_broadcast([acceptor.id for acceptor in quorum], message)
 
     def create_random_quorum(self):
-        m = len(self.assembly.acceptors) // 2 + 1
-        return set(choice(list(self.assembly.acceptors), m, replace=False))
+        acceptors = self.assembly.acceptors_tuple
+        return set(sample(acceptors, len(acceptors) // 2 + 1))
 
     def make_proposal(self):
-        return Proposal(self.id)
+        return intern_proposal(self.id)
+
+    def on_learnt(self) -> None:
+        self.assembly.notify_learnt()
 
 
 class Acceptor(Agent):
     def __init__(self, messenger: Messenger, assembly: Assembly,
-                 failure_rate: float = 0, avg_failure_duration: float = 5,
+                 failure_rate: float = 0, avg_failure_duration: float = 5, agent_id: Optional[int] = None
                  ):
-        super().__init__(messenger, failure_rate=failure_rate, avg_failure_duration=avg_failure_duration)
+        super().__init__(messenger, failure_rate=failure_rate, avg_failure_duration=avg_failure_duration,
+                         agent_id=agent_id)
         self.assembly: Assembly = assembly
+        self._handlers = handler_table({
+            MessageType.NextBallot: self.on_nextballot,
+            MessageType.BeginBallot: self.on_beginballot,
+            MessageType.Success: self.on_success,
+        })
         self.last_vote: Optional[Vote] = None
         self.next_ballot: Optional[BallotNumber] = None
 
-    def process_message(self, message: Message):
-        print(f"Agent #{self.id} received a {message.type} message from agent #{message.author_id}")
-        if message.type is MessageType.NextBallot:
-            self.on_nextballot(message)
-        elif message.type is MessageType.BeginBallot:
-            self.on_beginballot(message)
-        elif message.type is MessageType.Success:
-            self.on_success(message)
+    def reset(self) -> None:
+        super().reset()
+        self.last_vote = None
+        self.next_ballot = None
+
+    def process_message_batch(self, messages: List[Message]):
+        # Only the highest NextBallot of each proposer can get an answer: the previous ones belong to ballots it gave up
+        highest = dict()
+        for message in messages:
+            if message.type is MessageType.NextBallot:
+                best = highest.get(message.author_id)
+                if best is None or message.ballot_number > best.ballot_number:
+                    highest[message.author_id] = message
+        for message in messages:
+            if message.type is not MessageType.NextBallot or highest[message.author_id] is message:
+                self.process_message(message)
 
     def on_nextballot(self, message: Message):
         if self.next_ballot is None or message.ballot_number > self.next_ballot:
             self.next_ballot = message.ballot_number
-            response = Message(
-                author_id=self.id,
-                type=MessageType.LastVote,
-                ballot_number=message.ballot_number,
-                last_vote=self.last_vote
-            )
+            response = Message.make_last_vote(self.id, message.ballot_number, self.last_vote)
             self.messenger.send_message(message.author_id, response)
 
     def on_beginballot(self, message: Message):
         # If the ballot is the one the acceptor is waiting for
         if message.ballot.number == self.next_ballot:
             # It votes for it
-            self.last_vote = Vote(message.ballot, self)
+            self.last_vote = Vote(message.ballot, self.id)
             # And sends a Voted message to the proposer
-            response = Message(author_id=self.id, type=MessageType.Voted, vote=self.last_vote)
+            response = Message.make_voted(self.id, self.last_vote)
             self.messenger.send_message(message.author_id, response)
 
+    def on_learnt(self) -> None:
+        self.assembly.notify_learnt()
+
 
 class Assembly:
     def __init__(
             self,
             n_proposers: int,
             n_acceptors: int,
-            messenger: Messenger = ReliableMessenger(),
+            messenger: Optional[Messenger] = None,
+            # Average number of failures per second each proposer (resp. acceptor) is up
             proposer_fail_rate: float = 0,
             acceptor_fail_rate: float = 0,
             period_proposer: timedelta = timedelta(seconds=60)
             ):
-        self.messenger = messenger
-        self.proposers = {Proposer(self.messenger, self, failure_rate=proposer_fail_rate, period=period_proposer) for _ in range(n_proposers)}
-        self.acceptors = {Acceptor(self.messenger, self, failure_rate=acceptor_fail_rate) for _ in range(n_acceptors)}
-        self.threads = list()
+        # Agents are numbered from 0 to index their mailboxes, so every assembly needs a messenger of its own
+        self.messenger = messenger if messenger is not None else ReliableMessenger()
+        self.proposers = {Proposer(self.messenger, self, failure_rate=proposer_fail_rate, period=period_proposer,
+                                   agent_id=i) for i in range(n_proposers)}
+        self.acceptors = {Acceptor(self.messenger, self, failure_rate=acceptor_fail_rate,
+                                   agent_id=n_proposers + i) for i in range(n_acceptors)}
+        # The members of the assembly never change, they are gathered once and for all
+        self.agents = frozenset(self.proposers | self.acceptors)
+        self.all_agent_ids = [agent.id for agent in self.agents]
+        # Quorums are sampled from this sequence, which the proposers share
+        self.acceptors_tuple = tuple(self.acceptors)
+        # Set once every agent has learnt the decision, it belongs to the loop of the simulation under way
+        self.decision_made: Optional[asyncio.Event] = None
+        self._learnt = 0
+
+    def reset(self):
+        """Brings the assembly back to its initial state, so that it can be started again."""
+        self.messenger.reset()
+        for agent in self.agents:
+            agent.reset()
+        self._learnt = 0
 
-    @property
-    def agents(self):
-        return self.proposers.union(self.acceptors)
+    def notify_learnt(self):
+        """Called by every agent when it learns the decision, the last one wakes up `run'."""
+        self._learnt += 1
+        if self._learnt == len(self.proposers) + len(self.acceptors):
+            self.decision_made.set()
 
-    def start(self):
-        end = Event()
-        # We create a thread for the messenger if necessary
-        if isinstance(self.messenger, UnreliableMessenger):
-            # In this case, the messages are not delivered instantaneously
-            # The messenger needs its own thread so that it does not block the agents
-            self.threads.append(Thread(target=self.messenger.start, args=(end,), name="Messenger"))
-            self.threads[-1].start()
-        # And a thread for every agent
-        for agent in self.agents:
-            self.threads.append(Thread(target=agent.start, args=(end,), name=f'Agent #{agent.id}'))
-            self.threads[-1].start()
+    async def run(self):
+        end = asyncio.Event()
+        self.decision_made = asyncio.Event()
+        # Every agent runs as a task of the same loop, the delayed messages are scheduled on it as well
+        tasks = [asyncio.create_task(agent.run(end), name=f'Agent #{agent.id}') for agent in self.agents]
 
         # We wait until a decision is made and all agents learn about it
-        while None in [agent.ledger for agent in self.agents]:
-            continue
-        # When it is the case, we stop all the threads
+        await self.decision_made.wait()
+        # When it is the case, we stop all the agents, including those that are failing
         end.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def start(self):
+        asyncio.run(self.run())
 
         ledgers = set(agent.ledger.value for agent in self.agents)
         assert len(ledgers) == 1, f"Failure : more than one proposal was accepted by a majority of voters ({ledgers})"
@@ -197,6 +228,6 @@ class Assembly:
 
 if __name__ == '__main__':
     messenger = UnreliableMessenger(failure_rate=0.05, max_delay=10)
-    assembly = Assembly(n_proposers=2, n_acceptors=5, messenger=messenger, proposer_fail_rate=1e-8)
+    assembly = Assembly(n_proposers=2, n_acceptors=5, messenger=messenger, proposer_fail_rate=0.02)
     result = assembly.start()
     print(result)
@@ -1,191 +1,228 @@
 from __future__ import annotations
-from threading import Thread, Event
-from datetime import timedelta, datetime
+import asyncio
+import logging
+from datetime import timedelta
+from time import monotonic
 from typing import List, Optional
-from numpy.random import choice
+from random import sample
 
 from paxos.base_classes import *
 
+logger = logging.getLogger(__name__)
+
 
 class Proposer(Agent):
     def __init__(self, messenger: Messenger, assembly: Assembly,
                  failure_rate: float = 0, avg_failure_duration: float = 5,
-                 period: timedelta = timedelta(seconds=60)
+                 period: timedelta = timedelta(seconds=60), agent_id: Optional[int] = None
                  ):
-        super().__init__(messenger, failure_rate=failure_rate, avg_failure_duration=avg_failure_duration)
+        super().__init__(messenger, failure_rate=failure_rate, avg_failure_duration=avg_failure_duration,
+                         agent_id=agent_id)
         self.period = period
         self.assembly = assembly
+        self._handlers = handler_table({
+            MessageType.LastVote: self.on_lastvote,
+            MessageType.Voted: self.on_voted,
+            MessageType.Success: self.on_success,
+        })
         self.last_tried: List[Optional[Ballot]] = [None for _ in range(self.assembly.nb_instances)]
-        self.responses: List[List[Optional[Vote]]] = [list() for _ in range(self.assembly.nb_instances)]
+        # The LastVote responses to the current ballot of each instance are counted, only the highest vote they carry
+        #  is kept
+        self.nb_responses: List[int] = [0 for _ in range(self.assembly.nb_instances)]
+        self.best_vote: List[Optional[Vote]] = [None for _ in range(self.assembly.nb_instances)]
         self.ledger: List[Optional[Proposal]] = [None for _ in range(self.assembly.nb_instances)]
+        # The number of slots of the ledger that are filled
+        self.nb_learnt = 0
 
-    def start(self, event: Event) -> None:
-        t0 = datetime.now() - self.period + timedelta(seconds=5)
-        print(f"Agent #{self.id} started ({self.__class__.__name__})")
+    async def _run_once(self, event: asyncio.Event) -> None:
+        period = self.period.total_seconds()
+        # The first ballot is initiated 5 seconds after the proposer starts, then one every period
+        next_ballot_at = monotonic() + 5
+        logger.debug("Agent #%d started (%s)", self.id, self.__class__.__name__)
         self.messenger.register(self.id)
+        fail_at = self._draw_failure_time()
         while not event.is_set():
-            # Process messages received
-            message = self.messenger.get_message(self.id)
-            if message is not None:
-                self.process_message(message)
+            # A proposer has nothing to do until it gets a message, its next ballot is due or it fails
+            messages = await self._wait_for_messages(min(next_ballot_at, fail_at))
+            if messages:
+                self.process_message_batch(messages)
+            now = monotonic()
             # Regularly initiate ballots
-            if datetime.now() - t0 >= self.period:
-                t0 = datetime.now()
+            if now >= next_ballot_at:
+                next_ballot_at = now + period
                 self.initiate_new_ballot()
             # And maybe fail
-            if random() < self.failure_rate:
-                print(f"Agent #{self.id} failed ({self.__class__.__name__})")
-                sleep(self.avg_failure_duration * exponential())
+            if now >= fail_at:
+                await self._fail()
                 break
 
-        # If the agent failed, it starts again
-        if not event.is_set():
-            self.start(event)
+    def reset(self) -> None:
+        super().reset()
+        self.last_tried = [None for _ in range(self.assembly.nb_instances)]
+        self.nb_responses = [0 for _ in range(self.assembly.nb_instances)]
+        self.best_vote = [None for _ in range(self.assembly.nb_instances)]
+        self.ledger = [None for _ in range(self.assembly.nb_instances)]
+        self.nb_learnt = 0
 
-    def process_message(self, message: Message):
-        print(f"Agent #{self.id} received a {message.type} message from agent #{message.author_id}")
-        if message.type is MessageType.LastVote:
-            self.on_lastvote(message)
-        elif message.type is MessageType.Voted:
-            self.on_voted(message)
-        elif message.type is MessageType.Success:
-            self.on_success(message)
+    def current_instance(self, number: BallotNumber) -> Optional[int]:
+        """Returns the instance of the ballot the proposer is currently organizing with this number, if any."""
+        # The instance of a ballot is given by its number, only the current ballot of that instance can match
+        idx = number.ballot_id % self.assembly.nb_instances
+        ballot = self.last_tried[idx]
+        if ballot is not None and ballot.number == number:
+            return idx
+        return None
 
     def on_lastvote(self, message: Message):
         # The proposer checks whether the ballot number included in the message corresponds to
         #  a ballot that it is currently organizing
-        idx = None
-        for ballot in self.last_tried:
-            if message.ballot_number == ballot.number:
-                idx = self.last_tried.index(ballot)
+        idx = self.current_instance(message.ballot_number)
         # If it is the case
         if idx is not None:
-            self.responses[idx].append(message.last_vote)
+            ballot = self.last_tried[idx]
+            nb_responses = self.nb_responses[idx] = self.nb_responses[idx] + 1
+            vote, best = message.last_vote, self.best_vote[idx]
+            if vote is not None and (best is None or vote.ballot.number > best.ballot.number):
+                best = self.best_vote[idx] = vote
             # If all responses are received
-            if len(self.responses[idx]) == len(self.last_tried[idx].quorum):
-                # Sets the decree to satisfy B3
-                ballots = [v.ballot for v in self.responses[idx] if v is not None]
-                ballot_numbers = [b.number for b in ballots]
-                if ballots:
-                    max_number = max(ballot_numbers)
-                    max_ballot = [b for b in ballots if b.number == max_number][0]
-                    self.last_tried[idx].decree = max_ballot.decree
+            if nb_responses == ballot.quorum_size:
+                # Sets the decree to satisfy B3: the decree of the highest ballot any acceptor of the quorum voted for
+                if best is not None:
+                    ballot.decree = best.ballot.decree
                 else:
-                    self.last_tried[idx].decree = self.make_proposal()
+                    ballot.decree = self.make_proposal()
 
                 # Sends the BeginBallot message
-                reponse = Message(
-                    author_id=self.id,
-                    type=MessageType.BeginBallot,
-                    ballot=self.last_tried[idx],
-                    decree=self.last_tried[idx].decree,
-                )
-                for acceptor in self.last_tried[idx].quorum:
-                    self.messenger.send_message(acceptor.id, reponse)
+                reponse = Message.make_begin_ballot(self.id, ballot, ballot.decree)
+                self.messenger.send_broadcast(agent_ids(ballot.quorum), reponse)
 
     def on_voted(self, message: Message):
         # When the proposer receives a vote regarding its current ballot
-        idx = None
-        for ballot in self.last_tried:
-            if message.vote.ballot.number == ballot.number:
-                idx = self.last_tried.index(ballot)
+        idx = self.current_instance(message.vote.ballot.number)
 
         if idx is not None:
+            ballot = self.last_tried[idx]
             # It adds one voter
-            self.last_tried[idx].voters.add(message.vote.acceptor)
+            ballot.add_voter(message.vote.acceptor_id)
             # If the ballot becomes successful
-            if self.last_tried[idx].successful:
+            if ballot.successful:
                 # It sends a message to the whole assembly
-                response = Message(
-                    author_id=self.id,
-                    type=MessageType.Success,
-                    decree=self.last_tried[idx].decree,
-                    ballot_number=self.last_tried[idx].number
-                )
-                for agent in self.assembly.agents:
-                    self.messenger.send_message(agent.id, response)
+                response = Message.make_success(self.id, ballot.decree, ballot.number)
+                self.messenger.send_broadcast(self.assembly.all_agent_ids, response)
 
     def initiate_new_ballot(self):
         quorum = self.create_random_quorum()
-        print(f'{self} selected the following quorum : {quorum}')
+        logger.debug("%s selected the following quorum : %s", self, quorum)
+        quorum_mask = bitmask(quorum)
 
-        for idx in range(self.assembly.nb_instances):
+        messages = []
+        nb_instances, last_tried = self.assembly.nb_instances, self.last_tried
+        for idx in range(nb_instances):
             # With this definition for ballot numbers, every ballot related to instance idx has a ballot_id such that
             #  ballot_id % nb_instances == idx
-            if self.last_tried[idx] is None:
-                b = BallotNumber(idx, self.id)
+            previous = last_tried[idx]
+            if previous is None:
+                b = intern_ballot_number(idx, self.id)
             else:
-                b = BallotNumber(self.last_tried[idx].number.ballot_id + self.assembly.nb_instances, self.id)
-            self.last_tried[idx] = Ballot(b, Proposal(None), quorum, set())
-            self.responses[idx] = list()
-
-            message = Message(
-                author_id=self.id,
-                type=MessageType.NextBallot,
-                ballot_number=self.last_tried[idx].number,
-            )
-            for acceptor in self.last_tried[idx].quorum:
-                self.messenger.send_message(acceptor.id, message)
+                b = intern_ballot_number(previous.number.ballot_id + nb_instances, self.id)
+            last_tried[idx] = Ballot(b, NO_PROPOSAL, quorum_mask, 0)
+            self.nb_responses[idx] = 0
+            self.best_vote[idx] = None
+
+            messages.append(Message.make_next_ballot(self.id, b))
+        # Every acceptor of the quorum receives the NextBallot messages of all instances at once
+        for acceptor in quorum:
+            self.messenger.send_many(acceptor.id, messages)
 
     def create_random_quorum(self):
-        m = len(self.assembly.acceptors) // 2 + 1
-        return set(choice(list(self.assembly.acceptors), m, replace=False))
+        acceptors = self.assembly.acceptors_tuple
+        return set(sample(acceptors, len(acceptors) // 2 + 1))
 
     def make_proposal(self):
-        return Proposal(self.id)
+        return intern_proposal(self.id)
 
     def on_success(self, message) -> None:
-        print(f"Agent #{self.id} was notified that decree {message.decree} was accepted.")
-        self.ledger[message.ballot_number.ballot_id % self.assembly.nb_instances] = message.decree
+        logger.debug("Agent #%d was notified that decree %s was accepted.", self.id, message.decree)
+        idx = message.ballot_number.ballot_id % self.assembly.nb_instances
+        learnt = self.ledger[idx] is None
+        self.ledger[idx] = message.decree
+        if learnt:
+            self.nb_learnt += 1
+            if self.nb_learnt == self.assembly.nb_instances:
+                self.assembly.notify_learnt()
 
 
 class Acceptor(Agent):
     def __init__(self, messenger: Messenger, assembly: Assembly,
-                 failure_rate: float = 0, avg_failure_duration: float = 5,
+                 failure_rate: float = 0, avg_failure_duration: float = 5, agent_id: Optional[int] = None
                  ):
-        super().__init__(messenger, failure_rate=failure_rate, avg_failure_duration=avg_failure_duration)
+        super().__init__(messenger, failure_rate=failure_rate, avg_failure_duration=avg_failure_duration,
+                         agent_id=agent_id)
         self.assembly: Assembly = assembly
+        self._handlers = handler_table({
+            MessageType.NextBallot: self.on_nextballot,
+            MessageType.BeginBallot: self.on_beginballot,
+            MessageType.Success: self.on_success,
+        })
         self.last_vote: List[Optional[Vote]] = [None for _ in range(self.assembly.nb_instances)]
-        self.next_ballot: List[Optional[BallotNumber]] = [None for _ in range(self.assembly.nb_instances)]
+        # The packed key of the highest ballot number the acceptor answered in each instance, -1 before the first one,
+        #  so that checking a new ballot number is a single integer comparison
+        self.next_ballot_key: List[int] = [-1 for _ in range(self.assembly.nb_instances)]
         self.ledger: List[Optional[Ballot]] = [None for _ in range(self.assembly.nb_instances)]
+        # The number of slots of the ledger that are filled
+        self.nb_learnt = 0
+
+    def reset(self) -> None:
+        super().reset()
+        self.last_vote = [None for _ in range(self.assembly.nb_instances)]
+        self.next_ballot_key = [-1 for _ in range(self.assembly.nb_instances)]
+        self.ledger = [None for _ in range(self.assembly.nb_instances)]
+        self.nb_learnt = 0
 
-    def process_message(self, message: Message):
-        print(f"Agent #{self.id} received a {message.type} message from agent #{message.author_id}")
-        if message.type is MessageType.NextBallot:
-            self.on_nextballot(message)
-        elif message.type is MessageType.BeginBallot:
-            self.on_beginballot(message)
-        elif message.type is MessageType.Success:
-            self.on_success(message)
+    def process_message_batch(self, messages: List[Message]):
+        # Only the highest NextBallot of each proposer in each instance can get an answer: the previous ones belong to
+        #  ballots it gave up
+        highest = dict()
+        for message in messages:
+            if message.type is MessageType.NextBallot:
+                key = (message.author_id, message.ballot_number.ballot_id % self.assembly.nb_instances)
+                best = highest.get(key)
+                if best is None or message.ballot_number > best.ballot_number:
+                    highest[key] = message
+        for message in messages:
+            if message.type is not MessageType.NextBallot \
+                    or highest[message.author_id, message.ballot_number.ballot_id % self.assembly.nb_instances] is message:
+                self.process_message(message)
 
     def on_nextballot(self, message: Message):
         # The acceptor first needs to find to which instance of the protocol the corresponding ballot number is related
         idx = message.ballot_number.ballot_id % self.assembly.nb_instances
         # Then it checks whether it should react to this number in this instance or not
-        if self.next_ballot[idx] is None or message.ballot_number > self.next_ballot[idx]:
-            self.next_ballot[idx] = message.ballot_number
-            response = Message(
-                author_id=self.id,
-                type=MessageType.LastVote,
-                ballot_number=message.ballot_number,
-                last_vote=self.last_vote[idx]
-            )
+        if message.ballot_number.key > self.next_ballot_key[idx]:
+            self.next_ballot_key[idx] = message.ballot_number.key
+            response = Message.make_last_vote(self.id, message.ballot_number, self.last_vote[idx])
             self.messenger.send_message(message.author_id, response)
 
     def on_beginballot(self, message: Message):
         # The acceptor first needs to find to which instance of the protocol the corresponding ballot number is related
         idx = message.ballot.number.ballot_id % self.assembly.nb_instances
         # If the ballot is the one the acceptor is waiting for (in this instance)
-        if message.ballot.number == self.next_ballot[idx]:
+        if message.ballot.number.key == self.next_ballot_key[idx]:
             # It votes for it
-            self.last_vote[idx] = Vote(message.ballot, self)
+            self.last_vote[idx] = Vote(message.ballot, self.id)
             # And sends a Voted message to the proposer
-            response = Message(author_id=self.id, type=MessageType.Voted, vote=self.last_vote[idx])
+            response = Message.make_voted(self.id, self.last_vote[idx])
             self.messenger.send_message(message.author_id, response)
 
     def on_success(self, message) -> None:
-        print(f"Agent #{self.id} was notified that decree {message.decree} was accepted.")
-        self.ledger[message.ballot_number.ballot_id % self.assembly.nb_instances] = message.decree
+        logger.debug("Agent #%d was notified that decree %s was accepted.", self.id, message.decree)
+        idx = message.ballot_number.ballot_id % self.assembly.nb_instances
+        learnt = self.ledger[idx] is None
+        self.ledger[idx] = message.decree
+        if learnt:
+            self.nb_learnt += 1
+            if self.nb_learnt == self.assembly.nb_instances:
+                self.assembly.notify_learnt()
 
 
 class Assembly:
@@ -194,48 +231,63 @@ class Assembly:
             n_proposers: int,
             n_acceptors: int,
             nb_instances: int,
-            messenger: Messenger = ReliableMessenger(),
+            messenger: Optional[Messenger] = None,
+            # Average number of failures per second each proposer (resp. acceptor) is up
             proposer_fail_rate: float = 0,
             acceptor_fail_rate: float = 0,
             period_proposer: timedelta = timedelta(seconds=60)
             ):
         self.nb_instances = nb_instances
-        self.messenger = messenger
-        self.proposers = {Proposer(self.messenger, self, failure_rate=proposer_fail_rate, period=period_proposer) for _ in range(n_proposers)}
-        self.acceptors = {Acceptor(self.messenger, self, failure_rate=acceptor_fail_rate) for _ in range(n_acceptors)}
-        self.threads = list()
+        # Agents are numbered from 0 to index their mailboxes, so every assembly needs a messenger of its own
+        self.messenger = messenger if messenger is not None else ReliableMessenger()
+        self.proposers = {Proposer(self.messenger, self, failure_rate=proposer_fail_rate, period=period_proposer,
+                                   agent_id=i) for i in range(n_proposers)}
+        self.acceptors = {Acceptor(self.messenger, self, failure_rate=acceptor_fail_rate,
+                                   agent_id=n_proposers + i) for i in range(n_acceptors)}
+        # The members of the assembly never change, they are gathered once and for all
+        self.agents = frozenset(self.proposers | self.acceptors)
+        self.all_agent_ids = [agent.id for agent in self.agents]
+        # Quorums are sampled from this sequence, which the proposers share
+        self.acceptors_tuple = tuple(self.acceptors)
+        # Set once every agent has filled its whole ledger, it belongs to the loop of the simulation under way
+        self.decision_made: Optional[asyncio.Event] = None
+        self._learnt = 0
 
+    def reset(self):
+        """Brings the assembly back to its initial state, so that it can be started again."""
+        self.messenger.reset()
+        for agent in self.agents:
+            agent.reset()
+        self._learnt = 0
 
-    @property
-    def agents(self):
-        return self.proposers.union(self.acceptors)
+    def notify_learnt(self):
+        """Called by every agent when it has learnt the decisions of all instances, the last one wakes up `run'."""
+        self._learnt += 1
+        if self._learnt == len(self.proposers) + len(self.acceptors):
+            self.decision_made.set()
 
-    def start(self):
-        end = Event()
-        # We create a thread for the messenger if necessary
-        if isinstance(self.messenger, UnreliableMessenger):
-            # In this case, the messages are not delivered instantaneously
-            # The messenger needs its own thread so that it does not block the agents
-            self.threads.append(Thread(target=self.messenger.start, args=(end,), name="Messenger"))
-            self.threads[-1].start()
-        # And a thread for every agent
-        for agent in self.agents:
-            self.threads.append(Thread(target=agent.start, args=(end,), name=f'Agent #{agent.id}'))
-            self.threads[-1].start()
+    async def run(self):
+        end = asyncio.Event()
+        self.decision_made = asyncio.Event()
+        # Every agent runs as a task of the same loop, the delayed messages are scheduled on it as well
+        tasks = [asyncio.create_task(agent.run(end), name=f'Agent #{agent.id}') for agent in self.agents]
 
         # We wait until a decision is made and all agents learn about it
-        while None in [single_ledger for agent in self.agents for single_ledger in agent.ledger]:
-            continue
-        # When it is the case, we stop all the threads 
+        await self.decision_made.wait()
+        # When it is the case, we stop all the agents, including those that are failing
         end.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
-        ledgers_unique = []
-        for agent in self.agents:
-            if agent.ledger not in ledgers_unique:
-                ledgers_unique.append(agent.ledger)
+    def start(self):
+        asyncio.run(self.run())
+
+        # Ledgers are hashed as tuples, so that they are compared all at once instead of each against all the others
+        ledgers_unique = set(tuple(agent.ledger) for agent in self.agents)
         assert len(ledgers_unique) == 1,\
             f"Failure : more than one proposal was accepted by a majority of voters ({ledgers_unique})"
-        return ledgers_unique.pop()
+        return list(ledgers_unique.pop())
 
 
 if __name__ == '__main__':